@@ -10,6 +10,7 @@ import warnings
 
 from scipy.stats import norm
 from scipy.optimize import minimize
+from joblib import Parallel, delayed, effective_n_jobs
 
 from segregation.util.util import _dep_message, DeprecationHelper
 
@@ -113,6 +114,36 @@ def _dissim(data, group_pop_var, total_pop_var):
     return D, core_data
 
 
+def _dissim_np(group_pop, total_pop):
+    """
+    Calculation of Dissimilarity index from arrays of populations
+
+    Parameters
+    ----------
+
+    group_pop : numpy array
+                Population size of the group of interest of each unit. The index is calculated along the last axis, so a (simulations, units) array gives the index of each simulated population.
+                
+    total_pop : numpy array
+                Total population of each unit, with the same shape as group_pop
+
+    Returns
+    ----------
+
+    statistic : float or numpy array
+                Dissimilarity Index
+    
+    """
+    T = total_pop.sum(axis=-1, keepdims=True)
+    P = group_pop.sum(axis=-1, keepdims=True) / T
+    
+    # If a unit has zero population, the group of interest frequency is zero
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pi = np.where(total_pop == 0, 0, group_pop / total_pop)
+    
+    return ((total_pop * abs(pi - P)) / (2 * T * P * (1 - P))).sum(axis=-1)
+
+
 class Dissim:
     """
     Classic Dissimilarity Index
@@ -184,6 +215,7 @@ class Dissim:
         self.statistic = aux[0]
         self.core_data = aux[1]
         self._function = _dissim
+        self._function_np = _dissim_np
         
         
         
@@ -248,6 +280,49 @@ def _gini_seg(data, group_pop_var, total_pop_var):
     return G, core_data
 
 
+def _gini_seg_np(group_pop, total_pop):
+    """
+    Calculation of Gini Segregation index from arrays of populations
+
+    Parameters
+    ----------
+
+    group_pop : numpy array
+                Population size of the group of interest of each unit. The index is calculated along the last axis, so a (simulations, units) array gives the index of each simulated population.
+                
+    total_pop : numpy array
+                Total population of each unit, with the same shape as group_pop
+
+    Returns
+    ----------
+
+    statistic : float or numpy array
+                Gini Segregation Index
+    
+    Notes
+    -----
+    The sum over all pairs of units of ti * tj * |pi - pj| is taken from the units sorted by pi, comparing each unit only with the ones below it, instead of building the matrix of all pairs.
+    
+    """
+    T = total_pop.sum(axis=-1)
+    P = group_pop.sum(axis=-1) / T
+    
+    # If a unit has zero population, the group of interest frequency is zero
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pi = np.where(total_pop == 0, 0, group_pop / total_pop)
+    
+    order = np.argsort(pi, axis=-1)
+    pi = np.take_along_axis(pi, order, axis=-1)
+    ti = np.take_along_axis(total_pop, order, axis=-1).astype(float)
+    t_below = ti.cumsum(axis=-1) - ti
+    tp_below = (ti * pi).cumsum(axis=-1) - ti * pi
+    
+    # every pair is counted twice in the full sum
+    num = 2 * (ti * (pi * t_below - tp_below)).sum(axis=-1)
+    
+    return num / (2 * T**2 * P * (1 - P))
+
+
 class GiniSeg:
     """
     Classic Gini Segregation Index
@@ -314,6 +389,7 @@ class GiniSeg:
         self.statistic = aux[0]
         self.core_data = aux[1]
         self._function = _gini_seg
+        self._function_np = _gini_seg_np
         
         
         
@@ -1223,33 +1299,21 @@ def _modified_dissim(data, group_pop_var, total_pop_var, iterations = 500):
     if(iterations < 2):
         raise TypeError('iterations must be greater than 1.')
    
-    D = _dissim(data, group_pop_var, total_pop_var)[0]
+    # the simulations only need the population arrays, so the data is not copied
+    D, core_data = _dissim(data, group_pop_var, total_pop_var)
     
-    data = data.rename(columns={group_pop_var: 'group_pop_var', 
-                                total_pop_var: 'total_pop_var'})
-    
-    # core_data has to be in the beggining of the call because assign methods will be used later
-    if (str(type(data)) != '<class \'geopandas.geodataframe.GeoDataFrame\'>'):
-        core_data = data[['group_pop_var', 'total_pop_var']]
-    
-    else:    
-        core_data = data[['group_pop_var', 'total_pop_var', 'geometry']]
-    
-    x = np.array(data.group_pop_var)
-    t = np.array(data.total_pop_var)
+    x = core_data.group_pop_var.values
+    t = core_data.total_pop_var.values
     
     p_null = x.sum() / t.sum()
     
-    Ds = np.empty(iterations)
+    # all the simulations under evenness are drawn at once, one per row
+    freq_sims = np.random.binomial(n = t, p = p_null, size = (iterations, len(t)))
     
-    for i in np.array(range(iterations)):
-
-        freq_sim = np.random.binomial(n = np.array([t.tolist()]), 
-                                      p = np.array([[p_null] * data.shape[0]]), 
-                                      size = (1, data.shape[0])).tolist()[0]
-        data = data.assign(group_pop_var = freq_sim)
-        aux = _dissim(data, 'group_pop_var', 'total_pop_var')[0]
-        Ds[i] = aux
+    # the simulations are evaluated by the array version of the index, in chunks
+    # of about a million simulated units
+    n_chunks = min(iterations, freq_sims.size // 2**20 + 1)
+    Ds = np.concatenate([_dissim_np(chunk, t) for chunk in np.array_split(freq_sims, n_chunks)])
         
     D_star = Ds.mean()
     
@@ -1336,7 +1400,7 @@ class ModifiedDissim:
         self._function = _modified_dissim
         
         
-def _modified_gini_seg(data, group_pop_var, total_pop_var, iterations = 500):
+def _modified_gini_seg(data, group_pop_var, total_pop_var, iterations = 500, n_jobs = 1):
     """
     Calculation of Modified Gini Segregation index
 
@@ -1353,6 +1417,9 @@ def _modified_gini_seg(data, group_pop_var, total_pop_var, iterations = 500):
                     
     iterations    : int
                     The number of iterations the evaluate average classic gini segregation under eveness. Default value is 500.
+                    
+    n_jobs        : int
+                    The number of jobs used to evaluate the iterations in parallel with joblib. Default value is 1 (sequential); -1 uses all the processors.
 
     Returns
     ----------
@@ -1376,33 +1443,22 @@ def _modified_gini_seg(data, group_pop_var, total_pop_var, iterations = 500):
     if(iterations < 2):
         raise TypeError('iterations must be greater than 1.')
    
-    G = _gini_seg(data, group_pop_var, total_pop_var)[0]
+    # the simulations only need the population arrays, so the data is not copied
+    G, core_data = _gini_seg(data, group_pop_var, total_pop_var)
     
-    data = data.rename(columns={group_pop_var: 'group_pop_var', 
-                                total_pop_var: 'total_pop_var'})
-    
-    # core_data has to be in the beggining of the call because assign methods will be used later
-    if (str(type(data)) != '<class \'geopandas.geodataframe.GeoDataFrame\'>'):
-        core_data = data[['group_pop_var', 'total_pop_var']]
-    
-    else:    
-        core_data = data[['group_pop_var', 'total_pop_var', 'geometry']]
-    
-    x = np.array(data.group_pop_var)
-    t = np.array(data.total_pop_var)
+    x = core_data.group_pop_var.values
+    t = core_data.total_pop_var.values
     
     p_null = x.sum() / t.sum()
     
-    Gs = np.empty(iterations)
+    # all the simulations under evenness are drawn at once, one per row
+    freq_sims = np.random.binomial(n = t, p = p_null, size = (iterations, len(t)))
     
-    for i in np.array(range(iterations)):
-
-        freq_sim = np.random.binomial(n = np.array([t.tolist()]), 
-                                      p = np.array([[p_null] * data.shape[0]]), 
-                                      size = (1, data.shape[0])).tolist()[0]
-        data = data.assign(group_pop_var = freq_sim)
-        aux = _gini_seg(data, 'group_pop_var', 'total_pop_var')[0]
-        Gs[i] = aux
+    # the simulations are evaluated at once by the array version of the index, in
+    # one chunk per job or more, so that a chunk holds about a million simulated units
+    n_chunks = min(iterations, max(effective_n_jobs(n_jobs), freq_sims.size // 2**20 + 1))
+    Gs = np.concatenate(Parallel(n_jobs = n_jobs)(delayed(_gini_seg_np)(chunk, np.broadcast_to(t, chunk.shape))
+                                                  for chunk in np.array_split(freq_sims, n_chunks)))
         
     G_star = Gs.mean()
     
@@ -1431,6 +1487,9 @@ class ModifiedGiniSeg:
                     
     iterations    : int
                     The number of iterations the evaluate average classic gini segregation under eveness. Default value is 500.
+                    
+    n_jobs        : int
+                    The number of jobs used to evaluate the iterations in parallel with joblib. Default value is 1 (sequential); -1 uses all the processors.
 
     Attributes
     ----------
@@ -1480,9 +1539,9 @@ class ModifiedGiniSeg:
 
     """
 
-    def __init__(self, data, group_pop_var, total_pop_var, iterations = 500):
+    def __init__(self, data, group_pop_var, total_pop_var, iterations = 500, n_jobs = 1):
         
-        aux = _modified_gini_seg(data, group_pop_var, total_pop_var, iterations)
+        aux = _modified_gini_seg(data, group_pop_var, total_pop_var, iterations, n_jobs)
 
         self.statistic = aux[0]
         self.core_data = aux[1]
@@ -1553,7 +1612,7 @@ def _bias_corrected_dissim(data, group_pop_var, total_pop_var, B = 500):
 
     
     Dbcs = np.empty(B)
-    for i in np.array(range(B)):
+    for i in range(B):
         data_aux = {'simul_group': sim0[i].tolist(), 'simul_tot': (sim0[i] + sim1[i]).tolist()}
         df_aux = pd.DataFrame.from_dict(data_aux)
         Dbcs[i] = _dissim(df_aux, 'simul_group', 'simul_tot')[0]
@@ -50,7 +50,7 @@ __all__ = [
 np.seterr(divide='ignore', invalid='ignore')
 
 
-def _multi_dissim(data, groups):
+def _multi_dissim(data, groups, dtype=np.float64):
     """
     Calculation of Multigroup Dissimilarity index
 
@@ -61,6 +61,9 @@ def _multi_dissim(data, groups):
     
     groups : list of strings.
              The variables names in data of the groups of interest of the analysis.
+             
+    dtype  : numpy float type.
+             Precision of the unit level arrays. np.float32 halves their memory on large frames, at the cost of about 1e-6 of relative accuracy. Default is np.float64.
 
     Returns
     -------
@@ -81,22 +84,32 @@ def _multi_dissim(data, groups):
 
     core_data = data[groups]
 
-    df = np.array(core_data)
-
-    n = df.shape[0]
-    K = df.shape[1]
+    # (K, n) layout, one contiguous row per group, so that the sums over the
+    # units and over the groups both read contiguous memory
+    df = np.ascontiguousarray(core_data.values.T, dtype=dtype)
 
-    T = df.sum()
+    # the totals are always accumulated in double precision
+    T = df.sum(dtype=np.float64)
 
-    ti = df.sum(axis=1)
-    pik = df / ti[:, None]
-    Pk = df.sum(axis=0) / df.sum()
+    ti = df.sum(axis=0)
+    
+    # If a unit has zero population, the group frequencies are zero and the
+    # unit does not contribute to the index
+    pik = np.zeros_like(df)
+    np.divide(df, ti, out=pik, where=ti > 0)
+    
+    Pk = df.sum(axis=1, dtype=np.float64) / T
 
     Is = (Pk * (1 - Pk)).sum()
 
-    multi_D = 1 / (2 * T * Is) * np.multiply(
-        abs(pik - Pk),
-        np.repeat(ti, K, axis=0).reshape(n, K)).sum()
+    # the absolute deviations overwrite the frequencies, so no other (K, n)
+    # array is allocated
+    np.subtract(pik, Pk.astype(dtype)[:, None], out=pik)
+    np.abs(pik, out=pik)
+
+    # weighted sum of the absolute deviations in a single pass, without
+    # repeating ti along the groups
+    multi_D = np.einsum('ki,i->', pik, ti, dtype=np.float64) / (2 * T * Is)
 
     return multi_D, core_data
 
@@ -112,6 +125,9 @@ class MultiDissim:
     
     groups : list of strings.
              The variables names in data of the groups of interest of the analysis.
+             
+    dtype  : numpy float type.
+             Precision of the unit level arrays. np.float32 halves their memory on large frames, at the cost of about 1e-6 of relative accuracy. Default is np.float64.
 
     Attributes
     ----------
@@ -151,9 +167,9 @@ class MultiDissim:
 
     """
 
-    def __init__(self, data, groups):
+    def __init__(self, data, groups, dtype=np.float64):
 
-        aux = _multi_dissim(data, groups)
+        aux = _multi_dissim(data, groups, dtype)
 
         self.statistic = aux[0]
         self.core_data = aux[1]
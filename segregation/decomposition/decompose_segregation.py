@@ -5,19 +5,184 @@ Decomposition Segregation based Metrics
 __author__ = "Renan X. Cortes <renanc@ucr.edu>, Elijah Knaap <elijah.knaap@ucr.edu>, and Sergio J. Rey <sergio.rey@ucr.edu>"
 
 
-import warnings
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
 from segregation.util.util import _generate_counterfactual, _dep_message, DeprecationHelper
+from segregation.util.util import _COUNTERFACTUAL_CACHE as _GENERATED_COUNTERFACTUAL_CACHE
 
 # Including old and new api in __all__ so users can use both
 
 __all__ = ['Decompose_Segregation',
-           'DecomposeSegregation']
+           'DecomposeSegregation',
+           'decompose_segregation_batch',
+           'clear_counterfactual_cache']
 
 # The Deprecation calls of the classes are located in the end of this script #
 
+# Memoized counterfactual evaluations. Comparing one context against many
+# others (or re-running the same pair) repeatedly generates the same
+# counterfactuals, so they are kept in a small LRU cache.
+_COUNTERFACTUAL_CACHE = OrderedDict()
+_COUNTERFACTUAL_CACHE_SIZE = 512
+
+
+def _population_hash(core_data):
+    """Hash the population columns of the core_data of a segregation index."""
+    return int(
+        pd.util.hash_pandas_object(
+            core_data[['group_pop_var', 'total_pop_var']]).sum())
+
+
+def _core_data_key(core_data):
+    """Build a cache key for the core_data of a segregation index.
+
+    The key only depends on the content of the data: the population columns
+    and, for spatial indices, the geometries. Entries are therefore never
+    mixed up between different data, whatever happens to the original
+    DataFrame.
+    """
+    key = (len(core_data), _population_hash(core_data))
+    if 'geometry' in core_data.columns:
+        key += (int(
+            pd.util.hash_pandas_object(core_data.geometry.to_wkb(),
+                                       index=False).sum()), )
+    return key
+
+
+def clear_counterfactual_cache():
+    """Clear the memoized counterfactual data and index evaluations.
+
+    Decompositions (and counterfactual inference) keep the counterfactuals
+    they generate in bounded in-memory caches, so that comparing the same
+    contexts again is cheap. This empties them, releasing their memory.
+    """
+    _COUNTERFACTUAL_CACHE.clear()
+    _GENERATED_COUNTERFACTUAL_CACHE.clear()
+
+
+def _copy_evaluation(result):
+    """Copy of a cached counterfactual evaluation, so callers never share
+    the cached frames."""
+    counterfac_df1, counterfac_df2, G_S1_A2, G_S2_A1 = result
+    return counterfac_df1.copy(), counterfac_df2.copy(), G_S1_A2, G_S2_A1
+
+
+def _same_core_data(core_data1, core_data2):
+    """Check whether two indices were computed on the same data."""
+    if core_data1 is core_data2:
+        return True
+
+    if ((len(core_data1) != len(core_data2))
+            or (('geometry' in core_data1.columns) !=
+                ('geometry' in core_data2.columns))):
+        return False
+
+    if _population_hash(core_data1) != _population_hash(core_data2):
+        return False
+
+    # spatial indices also depend on where the populations are located
+    if 'geometry' in core_data1.columns:
+        return bool(
+            core_data1.geometry.reset_index(drop=True).geom_equals(
+                core_data2.geometry.reset_index(drop=True)).all())
+
+    return True
+
+
+def _counterfactual_frames(df1, df2, counterfactual_approach):
+    """Counterfactual compositions (and geometry) of two contexts.
+
+    Only generates the counterfactual data, without evaluating any index on
+    it.
+    """
+    counterfac_df1, counterfac_df2 = _generate_counterfactual(
+        df1,
+        df2,
+        'group_pop_var',
+        'total_pop_var',
+        counterfactual_approach=counterfactual_approach)
+    return _plot_columns(counterfac_df1), _plot_columns(counterfac_df2)
+
+
+def _select_core_columns(core_data):
+    """Select the population (and geometry, if any) columns of core_data."""
+    cols = ['group_pop_var', 'total_pop_var']
+    if 'geometry' in core_data.columns:
+        cols.append('geometry')
+    return core_data.loc[:, cols]
+
+
+def _plot_columns(counterfac_df):
+    """Keep only the counterfactual columns used by DecomposeSegregation.plot.
+
+    Decompositions are often run over many contexts, so retaining every
+    intermediate counterfactual variable per instance (and in the cache)
+    would hold on to memory that is never read again.
+    """
+    cols = ['group_composition', 'counterfactual_composition']
+    if 'geometry' in counterfac_df.columns:
+        cols.append('geometry')
+    return counterfac_df.loc[:, cols]
+
+
+def _counterfactual_evaluation(index1, index2, df1, df2,
+                               counterfactual_approach, dtype=np.float64):
+    """Generate the counterfactual data and evaluate the index on it.
+
+    Returns
+    -------
+    tuple
+        (counterfactual compositions (and geometry) for index1,
+         counterfactual compositions (and geometry) for index2,
+         index for spatial 1 attribute 2,
+         index for spatial 2 attribute 1)
+
+    """
+    seg_func = index1._function
+
+    key = (_core_data_key(index1.core_data), _core_data_key(index2.core_data),
+           counterfactual_approach, seg_func, np.dtype(dtype).str)
+
+    if key in _COUNTERFACTUAL_CACHE:
+        _COUNTERFACTUAL_CACHE.move_to_end(key)
+        return _copy_evaluation(_COUNTERFACTUAL_CACHE[key])
+
+    counterfac_df1, counterfac_df2 = _generate_counterfactual(
+        df1,
+        df2,
+        'group_pop_var',
+        'total_pop_var',
+        counterfactual_approach=counterfactual_approach)
+
+    cf_cols = ['counterfactual_group_pop', 'counterfactual_total_pop']
+    for counterfac_df in (counterfac_df1, counterfac_df2):
+        counterfac_df[cf_cols] = counterfac_df[cf_cols].astype(dtype, copy=False)
+
+    # index for spatial 1 attribute 2 (counterfactual population for structure 1)
+    G_S1_A2 = seg_func(counterfac_df1, 'counterfactual_group_pop',
+                       'counterfactual_total_pop')[0]
+
+    # index for spatial 2 attribute 1 (counterfactual population for structure 2)
+    G_S2_A1 = seg_func(counterfac_df2, 'counterfactual_group_pop',
+                       'counterfactual_total_pop')[0]
+
+    result = (_plot_columns(counterfac_df1), _plot_columns(counterfac_df2),
+              G_S1_A2, G_S2_A1)
+
+    _COUNTERFACTUAL_CACHE[key] = result
+    if len(_COUNTERFACTUAL_CACHE) > _COUNTERFACTUAL_CACHE_SIZE:
+        _COUNTERFACTUAL_CACHE.popitem(last=False)
+
+    return _copy_evaluation(result)
+
+
 def _decompose_segregation(index1,
                            index2,
-                           counterfactual_approach='composition'):
+                           counterfactual_approach='composition',
+                           dtype=np.float64):
     """Decompose segregation differences into spatial and attribute components.
 
     Given two segregation indices of the same type, use Shapley decomposition
@@ -34,6 +199,10 @@ def _decompose_segregation(index1,
                               ["composition", "share", "dual_composition"]
         The technique used to generate the counterfactual population
         distributions.
+    dtype : numpy dtype, default numpy.float64
+        Floating point type of the counterfactual populations the index is
+        evaluated on. numpy.float32 halves their memory footprint; results
+        may then differ from about the sixth significant digit.
 
     Returns
     -------
@@ -42,23 +211,30 @@ def _decompose_segregation(index1,
          shapley attribute component, 
          core data of index1, 
          core data of index2, 
-         data with counterfactual variables for index1, 
-         data with counterfactual variables for index2)
+         counterfactual compositions (and geometry) for index1, 
+         counterfactual compositions (and geometry) for index2)
 
     """
-    df1 = index1.core_data.copy()
-    df2 = index2.core_data.copy()
+    # Only the population columns (and geometry, when present) are consumed
+    # downstream. _generate_counterfactual copies its inputs before mutating
+    # them, so no extra copy of core_data is needed here.
+    df1 = _select_core_columns(index1.core_data)
+    df2 = _select_core_columns(index2.core_data)
 
     assert index1._function == index2._function, "Segregation indices must be of the same type"
 
-    counterfac_df1, counterfac_df2 = _generate_counterfactual(
-        df1,
-        df2,
-        'group_pop_var',
-        'total_pop_var',
-        counterfactual_approach=counterfactual_approach)
+    # Comparing a context with itself (same data and same index value): the
+    # counterfactual data of both sides are equal, so both Shapley components
+    # are zero and only the index evaluations on them can be skipped
+    if ((index1.statistic == index2.statistic)
+            and _same_core_data(index1.core_data, index2.core_data)):
+        counterfac_df1, counterfac_df2 = _counterfactual_frames(
+            df1, df2, counterfactual_approach)
+        return (0.0, 0.0, df1, df2, counterfac_df1, counterfac_df2,
+                counterfactual_approach)
 
-    seg_func = index1._function
+    counterfac_df1, counterfac_df2, G_S1_A2, G_S2_A1 = _counterfactual_evaluation(
+        index1, index2, df1, df2, counterfactual_approach, dtype)
 
     # index for spatial 1, attribute 1
     G_S1_A1 = index1.statistic
@@ -66,14 +242,6 @@ def _decompose_segregation(index1,
     # index for spatial 2, attribute 2
     G_S2_A2 = index2.statistic
 
-    # index for spatial 1 attribute 2 (counterfactual population for structure 1)
-    G_S1_A2 = seg_func(counterfac_df1, 'counterfactual_group_pop',
-                       'counterfactual_total_pop')[0]
-
-    # index for spatial 2 attribute 1 (counterfactual population for structure 2)
-    G_S2_A1 = seg_func(counterfac_df2, 'counterfactual_group_pop',
-                       'counterfactual_total_pop')[0]
-
     # take the average difference in spatial structure, holding attributes constant
     C_S = 1 / 2 * (G_S1_A1 - G_S2_A1 + G_S1_A2 - G_S2_A2)
 
@@ -83,6 +251,97 @@ def _decompose_segregation(index1,
     return C_S, C_A, df1, df2, counterfac_df1, counterfac_df2, counterfactual_approach
 
 
+def decompose_segregation_batch(indices,
+                                counterfactual_approach='composition',
+                                dtype=np.float64):
+    """Decompose segregation differences between every pair of indices.
+
+    Each unordered pair of contexts has its counterfactuals generated and
+    evaluated once, and the Shapley components of all pairs are then
+    obtained from matrix operations over the resulting index values.
+
+    Parameters
+    ----------
+    indices : list or dict of segregation.SegIndex classes
+        SegIndex classes of the same type to compare. If a dict is passed,
+        its keys are used to label the contexts.
+    counterfactual_approach : str, one of
+                              ["composition", "share", "dual_composition"]
+        The technique used to generate the counterfactual population
+        distributions.
+    dtype : numpy dtype, default numpy.float64
+        Floating point type of the counterfactual populations the indices
+        are evaluated on. See ``DecomposeSegregation``.
+
+    Returns
+    -------
+    tuple
+        (DataFrame of shapley spatial components,
+         DataFrame of shapley attribute components)
+
+        Entry (i, j) of each DataFrame is the component obtained by
+        decomposing index i against index j, as in
+        ``DecomposeSegregation(indices[i], indices[j])``.
+
+    """
+    if isinstance(indices, dict):
+        labels = list(indices.keys())
+        indices = list(indices.values())
+    else:
+        indices = list(indices)
+        labels = list(range(len(indices)))
+
+    for index in indices[1:]:
+        assert index._function == indices[0]._function, "Segregation indices must be of the same type"
+
+    n = len(indices)
+
+    # G[i] holds the index for spatial i, attribute i
+    G = np.array([index.statistic for index in indices])
+
+    # G_cf[i, j] holds the index for spatial i, attribute j
+    G_cf = np.diag(G)
+
+    for i in range(n):
+        for j in range(i + 1, n):
+            index1, index2 = indices[i], indices[j]
+            # equal indices on equal data have zero components (see
+            # _decompose_segregation)
+            if ((G[i] == G[j])
+                    and _same_core_data(index1.core_data, index2.core_data)):
+                G_cf[i, j], G_cf[j, i] = G[j], G[i]
+                continue
+            G_cf[i, j], G_cf[j, i] = _counterfactual_evaluation(
+                index1, index2, _select_core_columns(index1.core_data),
+                _select_core_columns(index2.core_data),
+                counterfactual_approach, dtype)[2:]
+
+    # same formulas as _decompose_segregation, for all pairs at once
+    C_S = 1 / 2 * (G[:, None] - G_cf.T + G_cf - G[None, :])
+    C_A = 1 / 2 * (G[:, None] - G_cf + G_cf.T - G[None, :])
+
+    return (pd.DataFrame(C_S, index=labels, columns=labels),
+            pd.DataFrame(C_A, index=labels, columns=labels))
+
+
+def _ecdf_segments(x):
+    """Step coordinates of the empirical CDF of x.
+
+    Returns the sorted non-missing values and the cumulative proportion of
+    observations up to each of them, ready for a post-step plot. A single
+    sort is the only pass over the data.
+    """
+    xs = np.asarray(x, dtype=float)
+    xs = np.sort(xs[~np.isnan(xs)])
+    ys = np.linspace(1 / len(xs), 1, len(xs))
+    return xs, ys
+
+
+def _mirror_ecdf(xs, ys):
+    """Step coordinates of the empirical CDF of 1 - x from those of x."""
+    return 1 - xs[::-1], ys
+
+
 class DecomposeSegregation:
     """Decompose segregation differences into spatial and attribute components.
 
@@ -100,6 +359,10 @@ class DecomposeSegregation:
                               ["composition", "share", "dual_composition"]
         The technique used to generate the counterfactual population
         distributions.
+    dtype : numpy dtype, default numpy.float64
+        Floating point type of the counterfactual populations the index is
+        evaluated on. numpy.float32 halves their memory footprint; results
+        may then differ from about the sixth significant digit.
 
     Attributes
     ----------
@@ -125,9 +388,11 @@ class DecomposeSegregation:
     
     """
 
-    def __init__(self, index1, index2, counterfactual_approach='composition'):
+    def __init__(self, index1, index2, counterfactual_approach='composition',
+                 dtype=np.float64):
 
-        aux = _decompose_segregation(index1, index2, counterfactual_approach)
+        aux = _decompose_segregation(index1, index2, counterfactual_approach,
+                                     dtype)
 
         self.c_s = aux[0]
         self.c_a = aux[1]
@@ -137,106 +402,58 @@ class DecomposeSegregation:
         self._counterfac_df2 = aux[5]
         self._counterfactual_approach = aux[6]
 
+    def _cdf_curves(self):
+        """Labelled empirical CDF step coordinates for the cdfs plot."""
+        if (self._counterfactual_approach == 'share'):
+            group_1 = self._df1['group_pop_var']
+            group_2 = self._df2['group_pop_var']
+            compl_1 = self._df1['total_pop_var'] - group_1
+            compl_2 = self._df2['total_pop_var'] - group_2
+
+            return [('First Context Group Share',
+                     _ecdf_segments(group_1 / group_1.sum())),
+                    ('Second Context Group Share',
+                     _ecdf_segments(group_2 / group_2.sum())),
+                    ('First Context Complementary Group Share',
+                     _ecdf_segments(compl_1 / compl_1.sum())),
+                    ('Second Context Complementary Group Share',
+                     _ecdf_segments(compl_2 / compl_2.sum()))]
+
+        curve_1 = _ecdf_segments(self._counterfac_df1['group_composition'])
+        curve_2 = _ecdf_segments(self._counterfac_df2['group_composition'])
+        curves = [('First Context Group Composition', curve_1),
+                  ('Second Context Group Composition', curve_2)]
+
+        if (self._counterfactual_approach == 'dual_composition'):
+            # the complementary composition is 1 - group_composition, so
+            # its CDF is the mirror image of the group composition CDF
+            curves += [('First Context Complementary Group Composition',
+                        _mirror_ecdf(*curve_1)),
+                       ('Second Context Complementary Group Composition',
+                        _mirror_ecdf(*curve_2))]
+
+        return curves
+
     def plot(self, plot_type='cdfs'):
         """
         Plot the Segregation Decomposition Profile
         """
+        import warnings
         try:
             import matplotlib.pyplot as plt
         except ImportError:
             warnings.warn('This method relies on importing `matplotlib`')
 
         if (plot_type == 'cdfs'):
-            if (self._counterfactual_approach == 'composition'):
-                plt.suptitle(
-                    'Spatial Component = {}, Attribute Component: {}'.format(
-                        round(self.c_s, 3), round(self.c_a, 3)),
-                    size=20)
-                plt.step(
-                    self._counterfac_df1['group_composition'].sort_values(),
-                    self._counterfac_df1['group_composition'].rank(
-                        pct=True).sort_values(),
-                    label='First Context Group Composition')
-
-                plt.step(
-                    self._counterfac_df2['group_composition'].sort_values(),
-                    self._counterfac_df2['group_composition'].rank(
-                        pct=True).sort_values(),
-                    label='Second Context Group Composition')
-                plt.legend()
-
-            if (self._counterfactual_approach == 'share'):
-                plt.suptitle(
-                    'Spatial Component = {}, Attribute Component: {}'.format(
-                        round(self.c_s, 3), round(self.c_a, 3)),
-                    size=20)
-                plt.step((self._df1['group_pop_var'] /
-                          self._df1['group_pop_var'].sum()).sort_values(),
-                         (self._df1['group_pop_var'] /
-                          self._df1['group_pop_var'].sum()).rank(
-                              pct=True).sort_values(),
-                         label='First Context Group Share')
-
-                plt.step((self._df2['group_pop_var'] /
-                          self._df2['group_pop_var'].sum()).sort_values(),
-                         (self._df2['group_pop_var'] /
-                          self._df2['group_pop_var'].sum()).rank(
-                              pct=True).sort_values(),
-                         label='Second Context Group Share')
-
-                plt.step(
-                    ((self._df1['total_pop_var'] - self._df1['group_pop_var'])
-                     / (self._df1['total_pop_var'] -
-                        self._df1['group_pop_var']).sum()).sort_values(),
-                    ((self._df1['total_pop_var'] - self._df1['group_pop_var'])
-                     / (self._df1['total_pop_var'] -
-                        self._df1['group_pop_var']).sum()).rank(
-                            pct=True).sort_values(),
-                    label='First Context Complementary Group Share')
-
-                plt.step(
-                    ((self._df2['total_pop_var'] - self._df2['group_pop_var'])
-                     / (self._df2['total_pop_var'] -
-                        self._df2['group_pop_var']).sum()).sort_values(),
-                    ((self._df2['total_pop_var'] - self._df2['group_pop_var'])
-                     / (self._df2['total_pop_var'] -
-                        self._df2['group_pop_var']).sum()).rank(
-                            pct=True).sort_values(),
-                    label='Second Context Complementary Group Share')
-                plt.legend()
-
-            if (self._counterfactual_approach == 'dual_composition'):
-                plt.suptitle(
-                    'Spatial Component = {}, Attribute Component: {}'.format(
-                        round(self.c_s, 3), round(self.c_a, 3)),
-                    size=20)
-                plt.step(
-                    self._counterfac_df1['group_composition'].sort_values(),
-                    self._counterfac_df1['group_composition'].rank(
-                        pct=True).sort_values(),
-                    label='First Context Group Composition')
-
-                plt.step(
-                    self._counterfac_df2['group_composition'].sort_values(),
-                    self._counterfac_df2['group_composition'].rank(
-                        pct=True).sort_values(),
-                    label='Second Context Group Composition')
-
-                plt.step(
-                    (1 -
-                     self._counterfac_df1['group_composition']).sort_values(),
-                    (1 - self._counterfac_df1['group_composition']).rank(
-                        pct=True).sort_values(),
-                    label='First Context Complementary Group Composition')
-
-                plt.step(
-                    (1 -
-                     self._counterfac_df2['group_composition']).sort_values(),
-                    (1 - self._counterfac_df2['group_composition']).rank(
-                        pct=True).sort_values(),
-                    label='Second Context Complementary Group Composition')
-
-                plt.legend()
+            plt.suptitle(
+                'Spatial Component = {}, Attribute Component: {}'.format(
+                    round(self.c_s, 3), round(self.c_a, 3)),
+                size=20)
+
+            for label, (xs, ys) in self._cdf_curves():
+                plt.step(xs, ys, where='post', label=label)
+
+            plt.legend()
 
         if (plot_type == 'maps'):
             if (str(type(self._df1)) !=
@@ -8,7 +8,9 @@ import numpy as np
 import pandas as pd
 import geopandas as gpd
 import warnings
+from itertools import islice
 from tqdm.auto import tqdm
+from joblib import Parallel, delayed
 from segregation.util.util import _generate_counterfactual, _dep_message, DeprecationHelper
 
 # Including old and new api in __all__ so users can use both
@@ -21,10 +23,217 @@ __all__ = [
 # The Deprecation calls of the classes are located in the end of this script #
 
 
+def _estimate_under_null(seg_class, group_pop, total_pop, geometry, kwargs):
+    '''
+    Evaluate the segregation measure of seg_class on one simulated population
+    '''
+    df_aux = pd.DataFrame(
+        {
+            'group_pop_var': group_pop,
+            'total_pop_var': total_pop
+        },
+        copy=False)
+
+    if geometry is not None:
+        df_aux = gpd.GeoDataFrame(df_aux, geometry=geometry)
+
+    return seg_class._function(df_aux, 'group_pop_var', 'total_pop_var',
+                               **kwargs)[0]
+
+
+# Samplers of the null hypotheses of _infer_segregation. Each one is a
+# generator yielding, for every iteration, the simulated group population,
+# total population and geometry (None if geometry is None) of the units.
+# The random draws are made in the same order as the original serial loops.
+
+
+def _systematic_samples(data, geometry, iterations_under_null, rng):
+    '''
+    Systematic null: multinomial allocation of both groups with p_j = n_j/n
+    '''
+    group_pop = data['group_pop_var'].values
+    total_pop = data['total_pop_var'].values
+    p_j = total_pop / total_pop.sum()
+
+    # Group 0: minority group
+    sim0 = rng.multinomial(group_pop.sum(), p_j, size=iterations_under_null)
+
+    # Group 1: complement group
+    sim1 = rng.multinomial((total_pop - group_pop).sum(),
+                           p_j,
+                           size=iterations_under_null)
+
+    # total population of every simulation in a single operation
+    sim_tot = sim0 + sim1
+    del sim1
+
+    for i in range(iterations_under_null):
+        yield sim0[i], sim_tot[i], geometry
+
+
+def _bootstrap_samples(data, geometry, iterations_under_null, rng):
+    '''
+    Bootstrap null: resampling of the units with replacement
+    '''
+    group_pop = data['group_pop_var'].values
+    total_pop = data['total_pop_var'].values
+    n_units = len(data)
+
+    for i in range(iterations_under_null):
+        sample_index = rng.choice(n_units, size=n_units, replace=True)
+        yield (group_pop[sample_index], total_pop[sample_index],
+               None if geometry is None else geometry[sample_index])
+
+
+def _evenness_samples(data, geometry, iterations_under_null, rng):
+    '''
+    Evenness null: binomial draws of the group with the global probability
+    '''
+    total_pop = data['total_pop_var'].values
+    p_null = data['group_pop_var'].sum() / total_pop.sum()
+
+    # draw every iteration in a single call (the draws are the same as
+    # one call per iteration)
+    sim = rng.binomial(n=total_pop,
+                       p=p_null,
+                       size=(iterations_under_null, len(data)))
+
+    for i in range(iterations_under_null):
+        yield sim[i], total_pop, geometry
+
+
+def _permutation_samples(data, geometry, iterations_under_null, rng):
+    '''
+    Permutation null: random allocation of the units over space
+    '''
+    group_pop = data['group_pop_var'].values
+    total_pop = data['total_pop_var'].values
+    n_units = len(data)
+
+    # each permutation reorders the previous arrangement
+    order = np.arange(n_units)
+    for i in range(iterations_under_null):
+        order = order[rng.choice(n_units, n_units, replace=False)]
+        yield (group_pop, total_pop,
+               None if geometry is None else geometry[order])
+
+
+def _systematic_permutation_samples(data, geometry, iterations_under_null,
+                                    rng):
+    '''
+    Systematic permutation null: systematic null allocated randomly over space
+    '''
+    n_units = len(data)
+    for group_pop, total_pop, _ in _systematic_samples(
+            data, None, iterations_under_null, rng):
+        permutation = rng.choice(n_units, n_units, replace=False)
+        yield (group_pop, total_pop,
+               None if geometry is None else geometry[permutation])
+
+
+def _even_permutation_samples(data, geometry, iterations_under_null, rng):
+    '''
+    Evenness permutation null: evenness null allocated randomly over space
+    '''
+    total_pop = data['total_pop_var'].values
+    p_null = data['group_pop_var'].sum() / total_pop.sum()
+    n_units = len(data)
+
+    # unlike _evenness_samples, the binomial draws alternate with the
+    # permutations
+    for i in range(iterations_under_null):
+        sim = rng.binomial(n=total_pop, p=p_null)
+        permutation = rng.choice(n_units, n_units, replace=False)
+        yield (sim, total_pop,
+               None if geometry is None else geometry[permutation])
+
+
+_SAMPLERS = {
+    'systematic': _systematic_samples,
+    'bootstrap': _bootstrap_samples,
+    'evenness': _evenness_samples,
+    'permutation': _permutation_samples,
+    'systematic_permutation': _systematic_permutation_samples,
+    'even_permutation': _even_permutation_samples
+}
+
+
+def _progress(simulations, iterations_under_null):
+    '''
+    Progress bar over the simulations, redrawn about a hundred times at most
+    '''
+    return tqdm(simulations,
+                total=iterations_under_null,
+                desc='Simulations under the null',
+                miniters=max(1, iterations_under_null // 100),
+                mininterval=0.25)
+
+
+def _random_generator(random_state):
+    '''
+    Source of the random draws of the simulations under the null hypothesis
+
+    The legacy global numpy random state (seeded with np.random.seed) is used if random_state is None. Otherwise, random_state seeds a numpy Generator, or is used as is if it is already one.
+    '''
+    if random_state is None:
+        return np.random
+    return np.random.default_rng(random_state)
+
+
+def _integer_core_data(core_data):
+    '''
+    Copy of core_data with the population columns rounded to integers
+    '''
+    return core_data.assign(
+        group_pop_var=np.round(core_data['group_pop_var'].values).astype(int),
+        total_pop_var=np.round(core_data['total_pop_var'].values).astype(int))
+
+
+def _difference_under_null(seg_class_1, seg_class_2, df_aux_1, df_aux_2,
+                           group_pop_var, total_pop_var, kwargs):
+    '''
+    Evaluate the difference of two segregation measures on one pair of simulated datasets
+    '''
+    return (
+        seg_class_1._function(df_aux_1, group_pop_var, total_pop_var,
+                              **kwargs)[0] -
+        seg_class_2._function(df_aux_2, group_pop_var, total_pop_var,
+                              **kwargs)[0])
+
+
+def _counterfactual_differences(seg_class_1, seg_class_2, data_1_test,
+                                data_2_test, sim_group_1, sim_group_2,
+                                kwargs):
+    '''
+    Evaluate the difference of two segregation measures on a block of counterfactual simulations
+    
+    sim_group_1 and sim_group_2 hold the simulated group populations of each iteration (rows) of the block. A single working copy of each dataset is allocated for the whole block, and only its group population column is replaced between iterations.
+    '''
+    data_1_test = data_1_test.assign(test_group_pop_var=sim_group_1[0])
+    data_2_test = data_2_test.assign(test_group_pop_var=sim_group_2[0])
+
+    differences = np.empty(len(sim_group_1))
+
+    # the column is replaced through pandas, since the arrays behind a frame
+    # are read-only under copy-on-write
+    for i in range(len(sim_group_1)):
+        data_1_test['test_group_pop_var'] = sim_group_1[i]
+        data_2_test['test_group_pop_var'] = sim_group_2[i]
+
+        differences[i] = _difference_under_null(seg_class_1, seg_class_2,
+                                                data_1_test, data_2_test,
+                                                'test_group_pop_var',
+                                                'total_pop_var', kwargs)
+
+    return differences
+
+
 def _infer_segregation(seg_class,
                        iterations_under_null=500,
                        null_approach="systematic",
                        two_tailed=True,
+                       n_jobs=1,
+                       random_state=None,
                        **kwargs):
     '''
     Perform inference for a single segregation measure
@@ -50,6 +259,12 @@ def _infer_segregation(seg_class,
     two_tailed    : boolean
                     If True, p_value is two-tailed. Otherwise, it is right one-tailed.
     
+    n_jobs        : int
+                    Number of processes used to evaluate the segregation measure on the simulated data. -1 uses all available cores. The default is 1, since the simulations are drawn serially and the evaluations are usually too cheap to pay off the start-up of worker processes.
+    
+    random_state  : None, int or numpy.random.Generator
+                    Seed or Generator for the random draws of the simulations. If None (default), the global numpy random state is used, so results can be reproduced with np.random.seed.
+    
     **kwargs      : customizable parameters to pass to the segregation measures. Usually they need to be the same input that the seg_class was built.
     
     Attributes
@@ -69,10 +284,7 @@ def _infer_segregation(seg_class,
     The one-tailed p_value attribute might not be appropriate for some measures, as the two-tailed. Therefore, it is better to rely on the est_sim attribute.
     
     '''
-    if not null_approach in [
-            'systematic', 'bootstrap', 'evenness', 'permutation',
-            'systematic_permutation', 'even_permutation'
-    ]:
+    if not null_approach in _SAMPLERS:
         raise ValueError(
             'null_approach must one of \'systematic\', \'bootstrap\', \'evenness\', \'permutation\', \'systematic_permutation\', \'even_permutation\''
         )
@@ -81,234 +293,71 @@ def _infer_segregation(seg_class,
         raise TypeError('two_tailed is not a boolean object')
 
     point_estimation = seg_class.statistic
-    data = seg_class.core_data.copy()
+    data = seg_class.core_data
+    rng = _random_generator(random_state)
+
+    is_geo = isinstance(data, gpd.GeoDataFrame)
+
+    if (null_approach in [
+            'permutation', 'systematic_permutation', 'even_permutation'
+    ] and not is_geo):
+        raise TypeError(
+            'data is not a GeoDataFrame, therefore, this null approach does not apply.'
+        )
 
     aux = str(type(seg_class))
     _class_name = aux[1 + aux.rfind(
         '.'):-2]  # 'rfind' finds the last occurence of a pattern in a string
 
-    ##############
-    # SYSTEMATIC #
-    ##############
-    if (null_approach == "systematic"):
-
-        data['other_group_pop'] = data['total_pop_var'] - data['group_pop_var']
-        p_j = data['total_pop_var'] / data['total_pop_var'].sum()
-
-        # Group 0: minority group
-        p0_i = p_j
-        n0 = data['group_pop_var'].sum()
-        sim0 = np.random.multinomial(n0, p0_i, size=iterations_under_null)
-
-        # Group 1: complement group
-        p1_i = p_j
-        n1 = data['other_group_pop'].sum()
-        sim1 = np.random.multinomial(n1, p1_i, size=iterations_under_null)
-
-        Estimates_Stars = np.empty(iterations_under_null)
-
-        with tqdm(total=iterations_under_null) as pbar:
-            for i in np.array(range(iterations_under_null)):
-                data_aux = {
-                    'simul_group': sim0[i].tolist(),
-                    'simul_tot': (sim0[i] + sim1[i]).tolist()
-                }
-                df_aux = pd.DataFrame.from_dict(data_aux)
-
-                if (str(type(data)) ==
-                        '<class \'geopandas.geodataframe.GeoDataFrame\'>'):
-                    df_aux = gpd.GeoDataFrame(df_aux)
-                    df_aux['geometry'] = data['geometry']
-
-                Estimates_Stars[i] = seg_class._function(
-                    df_aux, 'simul_group', 'simul_tot', **kwargs)[0]
-                pbar.set_description(
-                    'Processed {} iterations out of {}'.format(
-                        i + 1, iterations_under_null))
-                pbar.update(1)
-
-    #############
-    # BOOTSTRAP #
-    #############
-    if (null_approach == "bootstrap"):
-
-        Estimates_Stars = np.empty(iterations_under_null)
-
-        with tqdm(total=iterations_under_null) as pbar:
-            for i in np.array(range(iterations_under_null)):
-
-                sample_index = np.random.choice(data.index,
-                                                size=len(data),
-                                                replace=True)
-                df_aux = data.iloc[sample_index]
-                Estimates_Stars[i] = seg_class._function(
-                    df_aux, 'group_pop_var', 'total_pop_var', **kwargs)[0]
-
-                pbar.set_description(
-                    'Processed {} iterations out of {}'.format(
-                        i + 1, iterations_under_null))
-                pbar.update(1)
-
-    ############
-    # EVENNESS #
-    ############
-    if (null_approach == "evenness"):
-
-        p_null = data['group_pop_var'].sum() / data['total_pop_var'].sum()
-
-        Estimates_Stars = np.empty(iterations_under_null)
-
-        with tqdm(total=iterations_under_null) as pbar:
-            for i in np.array(range(iterations_under_null)):
-                sim = np.random.binomial(n=np.array(
-                    [data['total_pop_var'].tolist()]),
-                                         p=p_null)
-                data_aux = {
-                    'simul_group': sim[0],
-                    'simul_tot': data['total_pop_var'].tolist()
-                }
-                df_aux = pd.DataFrame.from_dict(data_aux)
-
-                if (str(type(data)) ==
-                        '<class \'geopandas.geodataframe.GeoDataFrame\'>'):
-                    df_aux = gpd.GeoDataFrame(df_aux)
-                    df_aux['geometry'] = data['geometry']
-
-                Estimates_Stars[i] = seg_class._function(
-                    df_aux, 'simul_group', 'simul_tot', **kwargs)[0]
-
-                pbar.set_description(
-                    'Processed {} iterations out of {}'.format(
-                        i + 1, iterations_under_null))
-                pbar.update(1)
-
-    ###############
-    # PERMUTATION #
-    ###############
-    if (null_approach == "permutation"):
-
-        if (str(type(data)) !=
-                '<class \'geopandas.geodataframe.GeoDataFrame\'>'):
-            raise TypeError(
-                'data is not a GeoDataFrame, therefore, this null approach does not apply.'
-            )
-
-        Estimates_Stars = np.empty(iterations_under_null)
-        with tqdm(total=iterations_under_null) as pbar:
-
-            for i in np.array(range(iterations_under_null)):
-                data = data.assign(geometry=data['geometry'][list(
-                    np.random.choice(
-                        data.shape[0], data.shape[0],
-                        replace=False))].reset_index()['geometry'])
-                df_aux = data
-                Estimates_Stars[i] = seg_class._function(
-                    df_aux, 'group_pop_var', 'total_pop_var', **kwargs)[0]
-                pbar.set_description(
-                    'Processed {} iterations out of {}'.format(
-                        i + 1, iterations_under_null))
-                pbar.update(1)
-
-    ##########################
-    # SYSTEMATIC PERMUTATION #
-    ##########################
-    if (null_approach == "systematic_permutation"):
-
-        if (str(type(data)) !=
-                '<class \'geopandas.geodataframe.GeoDataFrame\'>'):
-            raise TypeError(
-                'data is not a GeoDataFrame, therefore, this null approach does not apply.'
-            )
-
-        data['other_group_pop'] = data['total_pop_var'] - data['group_pop_var']
-        p_j = data['total_pop_var'] / data['total_pop_var'].sum()
-
-        # Group 0: minority group
-        p0_i = p_j
-        n0 = data['group_pop_var'].sum()
-        sim0 = np.random.multinomial(n0, p0_i, size=iterations_under_null)
-
-        # Group 1: complement group
-        p1_i = p_j
-        n1 = data['other_group_pop'].sum()
-        sim1 = np.random.multinomial(n1, p1_i, size=iterations_under_null)
-
-        Estimates_Stars = np.empty(iterations_under_null)
-
-        with tqdm(total=iterations_under_null) as pbar:
-            for i in np.array(range(iterations_under_null)):
-                data_aux = {
-                    'simul_group': sim0[i].tolist(),
-                    'simul_tot': (sim0[i] + sim1[i]).tolist()
-                }
-                df_aux = pd.DataFrame.from_dict(data_aux)
-                df_aux = gpd.GeoDataFrame(df_aux)
-                df_aux['geometry'] = data['geometry']
-                df_aux = df_aux.assign(geometry=df_aux['geometry'][list(
-                    np.random.choice(
-                        df_aux.shape[0], df_aux.shape[0],
-                        replace=False))].reset_index()['geometry'])
-                Estimates_Stars[i] = seg_class._function(
-                    df_aux, 'simul_group', 'simul_tot', **kwargs)[0]
-
-                pbar.set_description(
-                    'Processed {} iterations out of {}'.format(
-                        i + 1, iterations_under_null))
-                pbar.update(1)
-
-    ########################
-    # EVENNESS PERMUTATION #
-    ########################
-    if (null_approach == "even_permutation"):
-
-        if (str(type(data)) !=
-                '<class \'geopandas.geodataframe.GeoDataFrame\'>'):
-            raise TypeError(
-                'data is not a GeoDataFrame, therefore, this null approach does not apply.'
-            )
-
-        p_null = data['group_pop_var'].sum() / data['total_pop_var'].sum()
-
-        Estimates_Stars = np.empty(iterations_under_null)
-
-        with tqdm(total=iterations_under_null) as pbar:
-            for i in np.array(range(iterations_under_null)):
-                sim = np.random.binomial(n=np.array(
-                    [data['total_pop_var'].tolist()]),
-                                         p=p_null)
-                data_aux = {
-                    'simul_group': sim[0],
-                    'simul_tot': data['total_pop_var'].tolist()
-                }
-                df_aux = pd.DataFrame.from_dict(data_aux)
-                df_aux = gpd.GeoDataFrame(df_aux)
-                df_aux['geometry'] = data['geometry']
-                df_aux = df_aux.assign(geometry=df_aux['geometry'][list(
-                    np.random.choice(
-                        df_aux.shape[0], df_aux.shape[0],
-                        replace=False))].reset_index()['geometry'])
-                Estimates_Stars[i] = seg_class._function(
-                    df_aux, 'simul_group', 'simul_tot', **kwargs)[0]
-                pbar.set_description(
-                    'Processed {} iterations out of {}'.format(
-                        i + 1, iterations_under_null))
-                pbar.update(1)
+    # Indices with a numpy entry point only depend on the populations, so
+    # the simulations are evaluated together from (simulations x units) arrays
+    function_np = getattr(seg_class, '_function_np', None)
+    use_arrays = function_np is not None and not kwargs
+
+    # the geometries are never modified by the simulations, at most reordered
+    geometry = data.geometry.values if (is_geo and not use_arrays) else None
+
+    samples = _SAMPLERS[null_approach](data, geometry, iterations_under_null,
+                                       rng)
+
+    if use_arrays:
+        # chunks of about a million simulated units bound the memory of the
+        # temporaries of the index
+        chunk_size = max(1, 2**20 // max(1, len(data)))
+        estimates = []
+        chunk = list(islice(samples, chunk_size))
+        while chunk:
+            group_pops, total_pops, _ = zip(*chunk)
+            estimates.append(
+                function_np(np.array(group_pops), np.array(total_pops)))
+            chunk = list(islice(samples, chunk_size))
+        Estimates_Stars = np.concatenate(estimates)
+    else:
+        # The random draws happen in this process and only the index
+        # evaluations are distributed by joblib
+        Estimates_Stars = np.array(Parallel(n_jobs=n_jobs)(
+            delayed(_estimate_under_null)(seg_class, group_pop, total_pop,
+                                          sample_geometry, kwargs)
+            for group_pop, total_pop, sample_geometry in _progress(
+                samples, iterations_under_null)),
+                                   dtype=float)
 
     # Check and, if the case, remove iterations_under_null that resulted in nan or infinite values
-    if any((np.isinf(Estimates_Stars) | np.isnan(Estimates_Stars))):
+    finite = np.isfinite(Estimates_Stars)
+    if not finite.all():
         warnings.warn(
             'Some estimates resulted in NaN or infinite values for estimations under null hypothesis. These values will be removed for the final results.'
         )
-        Estimates_Stars = Estimates_Stars[~(np.isinf(Estimates_Stars)
-                                            | np.isnan(Estimates_Stars))]
+        Estimates_Stars = Estimates_Stars[finite]
+
+    n_above = np.count_nonzero(Estimates_Stars > point_estimation)
 
     if not two_tailed:
-        p_value = sum(
-            Estimates_Stars > point_estimation) / iterations_under_null
+        p_value = n_above / iterations_under_null
     else:
-        aux1 = (point_estimation < Estimates_Stars).sum()
-        aux2 = (point_estimation > Estimates_Stars).sum()
-        p_value = 2 * np.array([aux1, aux2]).min() / len(Estimates_Stars)
+        n_below = (len(Estimates_Stars) - n_above -
+                   np.count_nonzero(Estimates_Stars == point_estimation))
+        p_value = 2 * min(n_above, n_below) / len(Estimates_Stars)
 
     return p_value, Estimates_Stars, point_estimation, _class_name
 
@@ -338,6 +387,12 @@ class SingleValueTest:
     two_tailed    : boolean
                     If True, p_value is two-tailed. Otherwise, it is right one-tailed.
     
+    n_jobs        : int
+                    Number of processes used to evaluate the segregation measure on the simulated data. -1 uses all available cores. The default is 1, since the simulations are drawn serially and the evaluations are usually too cheap to pay off the start-up of worker processes.
+    
+    random_state  : None, int or numpy.random.Generator
+                    Seed or Generator for the random draws of the simulations. If None (default), the global numpy random state is used, so results can be reproduced with np.random.seed.
+    
     **kwargs      : customizable parameters to pass to the segregation measures. Usually they need to be the same input that the seg_class was built.
     
     Attributes
@@ -367,10 +422,13 @@ class SingleValueTest:
                  iterations_under_null=500,
                  null_approach="systematic",
                  two_tailed=True,
+                 n_jobs=1,
+                 random_state=None,
                  **kwargs):
 
         aux = _infer_segregation(seg_class, iterations_under_null,
-                                 null_approach, two_tailed, **kwargs)
+                                 null_approach, two_tailed, n_jobs,
+                                 random_state, **kwargs)
 
         self.p_value = aux[0]
         self.est_sim = aux[1]
@@ -404,6 +462,8 @@ def _compare_segregation(seg_class_1,
                          seg_class_2,
                          iterations_under_null=500,
                          null_approach="random_label",
+                         n_jobs=1,
+                         random_state=None,
                          **kwargs):
     '''
     Perform inference comparison for a two segregation measures
@@ -427,6 +487,10 @@ def _compare_segregation(seg_class_1,
         
         "counterfactual_dual_composition" : applies the "counterfactual_composition" for both minority and complementary groups.
 
+    n_jobs : number of processes used to evaluate the segregation measures on the simulated data. -1 uses all available cores. The default is 1.
+
+    random_state : None, int or numpy.random.Generator. Seed or Generator for the random draws of the simulations. If None (default), the global numpy random state is used, so results can be reproduced with np.random.seed.
+
     **kwargs : customizable parameters to pass to the segregation measures. Usually they need to be the same as both seg_class_1 and seg_class_2  was built.
     
     Attributes
@@ -464,70 +528,62 @@ def _compare_segregation(seg_class_1,
             'seg_class_1 and seg_class_2 must be the same type/class.')
 
     point_estimation = seg_class_1.statistic - seg_class_2.statistic
+    rng = _random_generator(random_state)
 
     aux = str(type(seg_class_1))
     _class_name = aux[1 + aux.rfind(
         '.'):-2]  # 'rfind' finds the last occurence of a pattern in a string
 
-    data_1 = seg_class_1.core_data.copy()
-    data_2 = seg_class_2.core_data.copy()
-
     # This step is just to make sure the each frequecy column is integer for the approaches and from the same type in order to stack them for the random data approach
-    data_1['group_pop_var'] = round(data_1['group_pop_var']).astype(int)
-    data_1['total_pop_var'] = round(data_1['total_pop_var']).astype(int)
-
-    data_2['group_pop_var'] = round(data_2['group_pop_var']).astype(int)
-    data_2['total_pop_var'] = round(data_2['total_pop_var']).astype(int)
-
-    est_sim = np.empty(iterations_under_null)
+    data_1 = _integer_core_data(seg_class_1.core_data)
+    data_2 = _integer_core_data(seg_class_2.core_data)
 
     ################
     # RANDOM LABEL #
     ################
     if (null_approach == "random_label"):
 
-        data_1['grouping_variable'] = 'Group_1'
-        data_2['grouping_variable'] = 'Group_2'
+        stacked_data = pd.concat([data_1, data_2],
+                                 ignore_index=True,
+                                 copy=False)
+
+        # each iteration only reorders the integer population counts
+        group_pop = stacked_data['group_pop_var'].values
+        total_pop = stacked_data['total_pop_var'].values
+        n_stacked = len(stacked_data)
 
-        stacked_data = pd.concat([data_1, data_2], ignore_index=True)
+        # rows of each group in the stacked data
+        is_group_1 = np.arange(n_stacked) < len(data_1)
+        rows_1 = np.flatnonzero(is_group_1)
+        rows_2 = np.flatnonzero(~is_group_1)
 
-        with tqdm(total=iterations_under_null) as pbar:
-            for i in np.array(range(iterations_under_null)):
+        def simulations():
+            for i in range(iterations_under_null):
 
-                aux_rand = list(
-                    np.random.choice(stacked_data.shape[0],
-                                     stacked_data.shape[0],
-                                     replace=False))
+                aux_rand = rng.choice(n_stacked, n_stacked, replace=False)
 
-                stacked_data['rand_group_pop'] = stacked_data.group_pop_var[
-                    aux_rand].reset_index()['group_pop_var']
-                stacked_data['rand_total_pop'] = stacked_data.total_pop_var[
-                    aux_rand].reset_index()['total_pop_var']
+                stacked_data['rand_group_pop'] = group_pop[aux_rand]
+                stacked_data['rand_total_pop'] = total_pop[aux_rand]
 
                 # Dropping variable to avoid confusion in the calculate_segregation function
                 # Building auxiliar data to avoid affecting the next iteration
                 stacked_data_aux = stacked_data.drop(
                     ['group_pop_var', 'total_pop_var'], axis=1)
 
-                stacked_data_1 = stacked_data_aux.loc[
-                    stacked_data_aux['grouping_variable'] == 'Group_1']
-                stacked_data_2 = stacked_data_aux.loc[
-                    stacked_data_aux['grouping_variable'] == 'Group_2']
-
-                simulations_1 = seg_class_1._function(stacked_data_1,
-                                                      'rand_group_pop',
-                                                      'rand_total_pop',
-                                                      **kwargs)[0]
-                simulations_2 = seg_class_2._function(stacked_data_2,
-                                                      'rand_group_pop',
-                                                      'rand_total_pop',
-                                                      **kwargs)[0]
-
-                est_sim[i] = simulations_1 - simulations_2
-                pbar.set_description(
-                    'Processed {} iterations out of {}'.format(
-                        i + 1, iterations_under_null))
-                pbar.update(1)
+                stacked_data_1 = stacked_data_aux.iloc[rows_1]
+                stacked_data_2 = stacked_data_aux.iloc[rows_2]
+
+                yield (stacked_data_1, stacked_data_2, 'rand_group_pop',
+                       'rand_total_pop')
+
+        est_sim = np.array(Parallel(n_jobs=n_jobs)(
+            delayed(_difference_under_null)(seg_class_1, seg_class_2,
+                                            df_aux_1, df_aux_2,
+                                            group_pop_var, total_pop_var,
+                                            kwargs)
+            for df_aux_1, df_aux_2, group_pop_var, total_pop_var in _progress(
+                simulations(), iterations_under_null)),
+                           dtype=float)
 
     ##############################
     # COUNTERFACTUAL COMPOSITION #
@@ -554,62 +610,73 @@ def _compare_segregation(seg_class_1,
                 'counterfactual_total_pop']
             data_2['total_pop_var'] = counterfac_df2[
                 'counterfactual_total_pop']
-        with tqdm(total=iterations_under_null) as pbar:
-            for i in np.array(range(iterations_under_null)):
-
-                data_1['fair_coin'] = np.random.uniform(size=len(data_1))
-                data_1['test_group_pop_var'] = np.where(
-                    data_1['fair_coin'] > 0.5, data_1['group_pop_var'],
-                    counterfac_df1['counterfactual_group_pop'])
-
-                # Dropping to avoid confusion in the internal function
-                data_1_test = data_1.drop(['group_pop_var'], axis=1)
-
-                simulations_1 = seg_class_1._function(data_1_test,
-                                                      'test_group_pop_var',
-                                                      'total_pop_var',
-                                                      **kwargs)[0]
-
-                # Dropping to avoid confusion in the next iteration
-                data_1 = data_1.drop(['fair_coin', 'test_group_pop_var'],
-                                     axis=1)
-
-                data_2['fair_coin'] = np.random.uniform(size=len(data_2))
-                data_2['test_group_pop_var'] = np.where(
-                    data_2['fair_coin'] > 0.5, data_2['group_pop_var'],
-                    counterfac_df2['counterfactual_group_pop'])
 
-                # Dropping to avoid confusion in the internal function
-                data_2_test = data_2.drop(['group_pop_var'], axis=1)
-
-                simulations_2 = seg_class_2._function(data_2_test,
-                                                      'test_group_pop_var',
-                                                      'total_pop_var',
-                                                      **kwargs)[0]
-
-                # Dropping to avoid confusion in the next iteration
-                data_2 = data_2.drop(['fair_coin', 'test_group_pop_var'],
-                                     axis=1)
-
-                est_sim[i] = simulations_1 - simulations_2
-
-                pbar.set_description(
-                    'Processed {} iterations out of {}'.format(
-                        i + 1, iterations_under_null))
-                pbar.update(1)
+        # The coins of every iteration are drawn at once. Each row holds the
+        # coins of data_1 followed by the ones of data_2, the same values a
+        # per-iteration draw for each side gives.
+        n_1 = len(data_1)
+        fair_coins = rng.random(size=(iterations_under_null,
+                                      n_1 + len(data_2))) > 0.5
+
+        # (iterations x units) arrays of the simulated group populations
+        sim_group_1 = np.where(fair_coins[:, :n_1],
+                               data_1['group_pop_var'].values,
+                               counterfac_df1['counterfactual_group_pop'].values)
+        sim_group_2 = np.where(fair_coins[:, n_1:],
+                               data_2['group_pop_var'].values,
+                               counterfac_df2['counterfactual_group_pop'].values)
+        del fair_coins
+
+        total_pop_1 = np.broadcast_to(data_1['total_pop_var'].values,
+                                      sim_group_1.shape)
+        total_pop_2 = np.broadcast_to(data_2['total_pop_var'].values,
+                                      sim_group_2.shape)
+
+        # Indices with a numpy entry point are evaluated on every simulation
+        # at once. Simulations with a group larger than the total population
+        # of a unit go through the index functions, which reject them.
+        function_np_1 = getattr(seg_class_1, '_function_np', None)
+        function_np_2 = getattr(seg_class_2, '_function_np', None)
+        use_arrays = (function_np_1 is not None
+                      and function_np_2 is not None and not kwargs
+                      and (sim_group_1 <= total_pop_1).all()
+                      and (sim_group_2 <= total_pop_2).all())
+
+        if use_arrays:
+            est_sim = (function_np_1(sim_group_1, total_pop_1) -
+                       function_np_2(sim_group_2, total_pop_2))
+        else:
+            # Dropping to avoid confusion in the internal function
+            data_1_test = data_1.drop(['group_pop_var'], axis=1)
+            data_2_test = data_2.drop(['group_pop_var'], axis=1)
+
+            # the simulations are evaluated in blocks, each one reusing a
+            # working copy of the data of each side
+            blocks = np.array_split(np.arange(iterations_under_null),
+                                    min(iterations_under_null, 100))
+
+            est_sim = np.concatenate(Parallel(n_jobs=n_jobs)(
+                delayed(_counterfactual_differences)(
+                    seg_class_1, seg_class_2, data_1_test, data_2_test,
+                    sim_group_1[block], sim_group_2[block], kwargs)
+                for block in _progress(blocks, len(blocks))))
 
     # Check and, if the case, remove iterations_under_null that resulted in nan or infinite values
-    if any((np.isinf(est_sim) | np.isnan(est_sim))):
+    finite = np.isfinite(est_sim)
+    if not finite.all():
         warnings.warn(
             'Some estimates resulted in NaN or infinite values for estimations under null hypothesis. These values will be removed for the final results.'
         )
-        est_sim = est_sim[~(np.isinf(est_sim) | np.isnan(est_sim))]
+        est_sim = est_sim[finite]
 
     # Two-Tailed p-value
     # Obs.: the null distribution can be located far from zero. Therefore, this is the the appropriate way to calculate the two tailed p-value.
-    aux1 = (point_estimation < est_sim).sum()
-    aux2 = (point_estimation > est_sim).sum()
-    p_value = 2 * np.array([aux1, aux2]).min() / len(est_sim)
+    # Both tails are counted from a single sorted copy of the simulations
+    sorted_est_sim = np.sort(est_sim)
+    n_below = np.searchsorted(sorted_est_sim, point_estimation, side='left')
+    n_above = len(sorted_est_sim) - np.searchsorted(
+        sorted_est_sim, point_estimation, side='right')
+    p_value = 2 * min(n_above, n_below) / len(est_sim)
 
     return p_value, est_sim, point_estimation, _class_name
 
@@ -637,6 +704,10 @@ class TwoValueTest:
         
         "counterfactual_dual_composition" : applies the "counterfactual_composition" for both minority and complementary groups.
 
+    n_jobs : number of processes used to evaluate the segregation measures on the simulated data. -1 uses all available cores. The default is 1.
+
+    random_state : None, int or numpy.random.Generator. Seed or Generator for the random draws of the simulations. If None (default), the global numpy random state is used, so results can be reproduced with np.random.seed.
+
     **kwargs : customizable parameters to pass to the segregation measures. Usually they need to be the same as both seg_class_1 and seg_class_2  was built.
     
     Attributes
@@ -670,11 +741,13 @@ class TwoValueTest:
                  seg_class_2,
                  iterations_under_null=500,
                  null_approach="random_label",
+                 n_jobs=1,
+                 random_state=None,
                  **kwargs):
 
         aux = _compare_segregation(seg_class_1, seg_class_2,
                                    iterations_under_null, null_approach,
-                                   **kwargs)
+                                   n_jobs, random_state, **kwargs)
 
         self.p_value = aux[0]
         self.est_sim = aux[1]
@@ -79,7 +79,8 @@ def calc_access(geodataframe,
                 distance=2000,
                 decay="linear",
                 variables=None,
-                precompute=True):
+                precompute=True,
+                node_ids=None):
     """Calculate access to population groups.
 
     Parameters
@@ -100,6 +101,11 @@ def calc_access(geodataframe,
         whether pandana should precompute the distance matrix. It can only be
         precomputed once, so If you plan to pass the same network to this
         function several times, you should set precompute=False for later runs
+    node_ids : array-like (optional)
+        network node id of each row of `geodataframe`. If None (the default),
+        they are looked up from the geodataframe centroids. Pass them when
+        calling this function repeatedly on the same data to avoid repeating
+        the lookup
 
     Returns
     -------
@@ -113,8 +119,10 @@ def calc_access(geodataframe,
     if precompute:
         network.precompute(distance)
 
-    geodataframe["node_ids"] = network.get_node_ids(geodataframe.centroid.x,
-                                                    geodataframe.centroid.y)
+    if node_ids is None:
+        node_ids = network.get_node_ids(geodataframe.centroid.x,
+                                        geodataframe.centroid.y)
+    geodataframe["node_ids"] = node_ids
 
     access = []
     for variable in variables:
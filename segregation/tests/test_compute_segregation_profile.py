@@ -0,0 +1,40 @@
+import unittest
+import libpysal
+import geopandas as gpd
+import numpy as np
+from libpysal.weights import Kernel
+from segregation.aspatial import MultiInformationTheory
+from segregation.spatial import SpatialInformationTheory, compute_segregation_profile
+
+
+class Compute_Segregation_Profile_Tester(unittest.TestCase):
+    def setUp(self):
+        self.s_map = gpd.read_file(libpysal.examples.get_path("sacramentot2.shp"))
+        self.groups = ['WHITE_', 'BLACK_', 'ASIAN_', 'HISP_']
+        # bandwidths relative to the extent of the map, whatever its units
+        width = self.s_map.total_bounds[2] - self.s_map.total_bounds[0]
+        self.distances = [width / 40, width / 20]
+
+    def test_Compute_Segregation_Profile(self):
+        aspatial = MultiInformationTheory(self.s_map, self.groups).statistic
+        for function in ['triangular', 'uniform', 'quadratic', 'quartic', 'gaussian']:
+            profile = compute_segregation_profile(self.s_map, self.groups, self.distances, function = function)
+            np.testing.assert_almost_equal(profile[0], aspatial)
+            for distance in self.distances:
+                w = Kernel.from_dataframe(self.s_map, bandwidth = distance, function = function)
+                index = SpatialInformationTheory(self.s_map, self.groups, w = w)
+                np.testing.assert_almost_equal(profile[distance], index.statistic)
+
+    def test_Compute_Segregation_Profile_Options(self):
+        profile = compute_segregation_profile(self.s_map, self.groups, self.distances)
+        parallel = compute_segregation_profile(self.s_map, self.groups, self.distances, n_jobs = 2)
+        threads = compute_segregation_profile(self.s_map, self.groups, self.distances, n_jobs = 2, backend = 'threading')
+        single = compute_segregation_profile(self.s_map, self.groups, self.distances, dtype = np.float32)
+        for distance in [0] + self.distances:
+            np.testing.assert_almost_equal(parallel[distance], profile[distance])
+            np.testing.assert_almost_equal(threads[distance], profile[distance])
+            np.testing.assert_almost_equal(single[distance], profile[distance], decimal = 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,8 +2,10 @@ import unittest
 import libpysal
 import geopandas as gpd
 import numpy as np
+from libpysal.weights import KNN
 from segregation.aspatial import Dissim
-from segregation.decomposition import DecomposeSegregation
+from segregation.spatial import SpatialDissim
+from segregation.decomposition import DecomposeSegregation, decompose_segregation_batch
 
 
 class Decomposition_Tester(unittest.TestCase):
@@ -29,5 +31,31 @@ class Decomposition_Tester(unittest.TestCase):
         res.plot(plot_type = 'cdfs')
         res.plot(plot_type = 'maps')
 
+    def test_Decomposition_Batch(self):
+        s_map = gpd.read_file(libpysal.examples.get_path("sacramentot2.shp"))
+        index1 = Dissim(s_map, 'HISP_', 'TOT_POP')
+        index2 = Dissim(s_map, 'BLACK_', 'TOT_POP')
+        index3 = Dissim(s_map, 'ASIAN_', 'TOT_POP')
+        c_s, c_a = decompose_segregation_batch([index1, index2, index3], counterfactual_approach = "composition")
+        np.testing.assert_almost_equal(c_a.loc[0, 1], -0.16138819842911295)
+        np.testing.assert_almost_equal(c_s.loc[0, 1], -0.005104643275796905)
+        np.testing.assert_almost_equal(np.diag(c_s), 0)
+        
+        res = DecomposeSegregation(index3, index2, counterfactual_approach = "composition")
+        np.testing.assert_almost_equal(c_a.loc[2, 1], res.c_a)
+        np.testing.assert_almost_equal(c_s.loc[2, 1], res.c_s)
+        
+    def test_Decomposition_Same_Data(self):
+        s_map = gpd.read_file(libpysal.examples.get_path("sacramentot2.shp"))
+        index1 = SpatialDissim(s_map, 'HISP_', 'TOT_POP')
+        index2 = SpatialDissim(s_map, 'HISP_', 'TOT_POP', w = KNN.from_dataframe(s_map, k = 8))
+        res = DecomposeSegregation(index1, index2, counterfactual_approach = "composition")
+        np.testing.assert_almost_equal(res.c_s + res.c_a, index1.statistic - index2.statistic)
+        self.assertNotAlmostEqual(res.c_s, 0)
+        
+        c_s, c_a = decompose_segregation_batch([index1, index2], counterfactual_approach = "composition")
+        np.testing.assert_almost_equal(c_s.loc[0, 1], res.c_s)
+        np.testing.assert_almost_equal(c_a.loc[0, 1], res.c_a)
+
 if __name__ == '__main__':
     unittest.main()
@@ -2,7 +2,8 @@ import unittest
 import libpysal
 import geopandas as gpd
 import numpy as np
-from segregation.aspatial import Dissim
+import pandas as pd
+from segregation.aspatial import Dissim, GiniSeg
 from segregation.inference import SingleValueTest, TwoValueTest
 
 
@@ -54,6 +55,31 @@ class Inference_Tester(unittest.TestCase):
         res = TwoValueTest(index1, index2, null_approach = "counterfactual_dual_composition", iterations_under_null = 50)
         np.testing.assert_almost_equal(res.est_sim.mean(), -0.004771386292706747)
 
+    def test_Random_State(self):
+        s_map = gpd.read_file(libpysal.examples.get_path("sacramentot2.shp"))
+        index1 = Dissim(s_map, 'HISP_', 'TOT_POP')
+        index2 = Dissim(s_map, 'BLACK_', 'TOT_POP')
+        
+        res1 = SingleValueTest(index1, null_approach = "bootstrap", iterations_under_null = 20, random_state = 42)
+        res2 = SingleValueTest(index1, null_approach = "bootstrap", iterations_under_null = 20, random_state = np.random.default_rng(42))
+        np.testing.assert_array_equal(res1.est_sim, res2.est_sim)
+        
+        res1 = TwoValueTest(index1, index2, null_approach = "random_label", iterations_under_null = 20, random_state = 42)
+        res2 = TwoValueTest(index1, index2, null_approach = "random_label", iterations_under_null = 20, random_state = 42)
+        np.testing.assert_array_equal(res1.est_sim, res2.est_sim)
+
+    def test_Function_Np(self):
+        s_map = gpd.read_file(libpysal.examples.get_path("sacramentot2.shp"))
+        np.random.seed(123)
+        total_pop = np.random.binomial(s_map['TOT_POP'].values, 0.9, size=(5, len(s_map)))
+        group_pop = np.random.binomial(total_pop, 0.2)
+        
+        for index in [Dissim(s_map, 'HISP_', 'TOT_POP'), GiniSeg(s_map, 'HISP_', 'TOT_POP')]:
+            batch = index._function_np(group_pop, total_pop)
+            for i in range(5):
+                df = pd.DataFrame({'group': group_pop[i], 'total': total_pop[i]})
+                np.testing.assert_almost_equal(batch[i], index._function(df, 'group', 'total')[0])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -12,6 +12,8 @@ class Multi_Dissim_Tester(unittest.TestCase):
         df = s_map[groups_list]
         index = MultiDissim(df, groups_list)
         np.testing.assert_almost_equal(index.statistic, 0.41340872573177806)
+        index_32 = MultiDissim(df, groups_list, dtype = np.float32)
+        np.testing.assert_allclose(index_32.statistic, index.statistic, rtol = 1e-5)
 
 
 if __name__ == '__main__':
@@ -1,4 +1,3 @@
-import matplotlib.pyplot as plt
 import numpy as np
 
 
@@ -25,6 +24,8 @@ def plot_cdf(group_share1, group_share2, label1='', label2=''):
         matplotlib Figure.
 
     """
+    import matplotlib.pyplot as plt
+
     plt.step(group_share1.sort_values(),
              group_share1.rank(pct=True).sort_values(),
              label=label1)
@@ -52,6 +53,7 @@ def lorenz(X):
         matplotlib.Figure
 
     """
+    import matplotlib.pyplot as plt
 
     fig, ax = plt.subplots(figsize=[6, 6])
 
@@ -7,6 +7,23 @@ __author__ = "Levi Wolf <levi.john.wolf@gmail.com>, Renan X. Cortes <renanc@ucr.
 
 import numpy as np
 import math
+import hashlib
+from collections import OrderedDict
+
+# Counterfactual columns already generated, keyed by a digest of the
+# population vectors of both contexts and the approach. Bounded LRU.
+_COUNTERFACTUAL_CACHE = OrderedDict()
+_COUNTERFACTUAL_CACHE_SIZE = 128
+
+
+def _population_digest(data, group_pop_var, total_pop_var):
+    """Digest of the population vectors of a context, used as a cache key."""
+    digest = hashlib.blake2b(digest_size=16)
+    for var in (group_pop_var, total_pop_var):
+        values = np.ascontiguousarray(data[var].values)
+        digest.update(str(values.dtype).encode())
+        digest.update(values.tobytes())
+    return digest.hexdigest()
 
 
 def _generate_counterfactual(data1,
@@ -67,6 +84,47 @@ def _generate_counterfactual(data1,
             'Group of interest population must equal or lower than the total population of the units in data2.'
         )
 
+    key = (_population_digest(data1, group_pop_var, total_pop_var),
+           _population_digest(data2, group_pop_var, total_pop_var),
+           counterfactual_approach)
+
+    if key in _COUNTERFACTUAL_CACHE:
+        _COUNTERFACTUAL_CACHE.move_to_end(key)
+        columns1, columns2 = _COUNTERFACTUAL_CACHE[key]
+    else:
+        columns1, columns2 = _counterfactual_columns(
+            data1[[group_pop_var, total_pop_var]],
+            data2[[group_pop_var, total_pop_var]], group_pop_var,
+            total_pop_var, counterfactual_approach)
+        _COUNTERFACTUAL_CACHE[key] = (columns1, columns2)
+        if len(_COUNTERFACTUAL_CACHE) > _COUNTERFACTUAL_CACHE_SIZE:
+            _COUNTERFACTUAL_CACHE.popitem(last=False)
+
+    df1 = data1.copy()
+    df2 = data2.copy()
+
+    # copies keep the cached arrays safe from in-place edits of the output
+    for column, values in columns1.items():
+        df1[column] = values.copy()
+    for column, values in columns2.items():
+        df2[column] = values.copy()
+
+    df1 = df1.drop(columns=['group_pop_var', 'total_pop_var'], axis=1)
+    df2 = df2.drop(columns=['group_pop_var', 'total_pop_var'], axis=1)
+
+    return df1, df2
+
+
+def _counterfactual_columns(data1, data2, group_pop_var, total_pop_var,
+                            counterfactual_approach):
+    """Compute the counterfactual variables of two contexts.
+
+    Returns
+    -------
+    two dicts
+        column name to values of the variables generated for data1 and data2
+
+    """
     df1 = data1.copy()
     df2 = data2.copy()
 
@@ -189,10 +247,16 @@ def _generate_counterfactual(data1,
         df2['counterfactual_total_pop'] == 0, 0,
         df2['counterfactual_group_pop'] / df2['counterfactual_total_pop'])
 
-    df1 = df1.drop(columns=['group_pop_var', 'total_pop_var'], axis=1)
-    df2 = df2.drop(columns=['group_pop_var', 'total_pop_var'], axis=1)
+    columns1 = {
+        column: df1[column].values
+        for column in df1.columns if column not in data1.columns
+    }
+    columns2 = {
+        column: df2[column].values
+        for column in df2.columns if column not in data2.columns
+    }
 
-    return df1, df2
+    return columns1, columns2
 
 
 def project_gdf(gdf, to_crs=None, to_latlong=False):